@@ -0,0 +1,288 @@
+# External imports
+import threading
+from collections.abc import MutableMapping
+
+INDEXED_FIELDS = ("running_status", "docker_image")
+
+
+class LabState(dict):
+    """
+    The state dict of a single lab.
+
+    Behaves like a plain dict, but tells its owning LabIndex whenever an
+    indexed field (running_status, docker_image) is set or removed, through
+    any dict method, so the secondary indexes stay in sync with in-place
+    updates like `state["running_status"] = "running"`.
+    """
+
+    __slots__ = ("_index", "_lab_id")
+
+    def __init__(self, index, lab_id, state):
+        super().__init__(state)
+        self._index = index
+        self._lab_id = lab_id
+
+    def _changed(self, key, old, new):
+        # Callers hold the index lock. A state dropped from the index no longer affects it.
+        if key in INDEXED_FIELDS and self._index._labs.get(self._lab_id) is self:
+            self._index._move(self._lab_id, key, old, new)
+
+    def __setitem__(self, key, value):
+        with self._index._lock:
+            old = self.get(key)
+            super().__setitem__(key, value)
+            self._changed(key, old, value)
+
+    def __delitem__(self, key):
+        with self._index._lock:
+            old = self[key]
+            super().__delitem__(key)
+            self._changed(key, old, None)
+
+    def pop(self, key, *default):
+        with self._index._lock:
+            if key not in self:
+                if default:
+                    return default[0]
+                raise KeyError(key)
+            value = super().pop(key)
+            self._changed(key, value, None)
+            return value
+
+    def popitem(self):
+        with self._index._lock:
+            key, value = super().popitem()
+            self._changed(key, value, None)
+            return key, value
+
+    def setdefault(self, key, default=None):
+        with self._index._lock:
+            if key not in self:
+                self[key] = default
+            return self[key]
+
+    def clear(self):
+        with self._index._lock:
+            for key in INDEXED_FIELDS:
+                if key in self:
+                    self._changed(key, self[key], None)
+            super().clear()
+
+    def update(self, *args, **kwargs):
+        with self._index._lock:
+            for key, value in dict(*args, **kwargs).items():
+                self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def sync(self, state):
+        """
+        Makes this state equal to `state` in place.
+
+        Parameters:
+        -----------
+        state: dict
+            The new content.
+        """
+        with self._index._lock:
+            for key in list(self):
+                if key not in state:
+                    del self[key]
+            self.update(state)
+
+
+class LabIndex(MutableMapping):
+    """
+    In-memory store of lab states keyed by lab_id, with secondary indexes by
+    running_status and by docker_image.
+
+    It is a drop-in replacement for the plain container_states dict: values
+    are LabState dicts and in-place updates of indexed fields are tracked.
+    Assigning to an existing lab_id, or replace(), updates the existing
+    LabState in place, so references held by other threads stay attached.
+
+    Methods:
+    --------
+    replace(states)
+        Makes the index hold exactly the given lab states, in place.
+    snapshot()
+        Returns a plain dict copy, e.g. for JSON serialization.
+    lab_ids_with_status(running_status)
+        Returns the lab ids with the given running_status.
+    lab_ids_with_image(docker_image)
+        Returns the lab ids using the given docker_image.
+    select(statuses=None, docker_image=None)
+        Returns the sorted lab ids matching all given filters.
+    query(statuses=None, docker_image=None, offset=0, limit=None)
+        Returns a page of (lab_id, state) pairs matching the filters.
+    """
+
+    def __init__(self, states=None):
+        """
+        Constructor for the LabIndex class.
+
+        Parameters:
+        -----------
+        states: dict
+            Initial {lab_id: state} mapping.
+        """
+        self._lock = threading.RLock()
+        self._labs = {}
+        self._by_field = {field: {} for field in INDEXED_FIELDS}
+        if states:
+            self.replace(states)
+
+    def _move(self, lab_id, field, old, new):
+        buckets = self._by_field[field]
+        if old is not None:
+            bucket = buckets.get(old)
+            if bucket is not None:
+                bucket.discard(lab_id)
+                if not bucket:
+                    del buckets[old]
+        if new is not None:
+            buckets.setdefault(new, set()).add(lab_id)
+
+    def __getitem__(self, lab_id):
+        return self._labs[lab_id]
+
+    def __setitem__(self, lab_id, state):
+        with self._lock:
+            existing = self._labs.get(lab_id)
+            if existing is not None:
+                existing.sync(state)
+                return
+            lab_state = LabState(self, lab_id, state)
+            self._labs[lab_id] = lab_state
+            for field in INDEXED_FIELDS:
+                self._move(lab_id, field, None, lab_state.get(field))
+
+    def __delitem__(self, lab_id):
+        with self._lock:
+            lab_state = self._labs.pop(lab_id)
+            for field in INDEXED_FIELDS:
+                self._move(lab_id, field, lab_state.get(field), None)
+
+    def __iter__(self):
+        return iter(list(self._labs))
+
+    def __len__(self):
+        return len(self._labs)
+
+    def __contains__(self, lab_id):
+        return lab_id in self._labs
+
+    def replace(self, states):
+        """
+        Makes the index hold exactly the given lab states. Labs missing from
+        `states` are removed; existing labs are updated in place.
+
+        Parameters:
+        -----------
+        states: dict
+            The new {lab_id: state} mapping. Non-dict values are skipped.
+        """
+        with self._lock:
+            states = {lab_id: state for lab_id, state in states.items() if isinstance(state, dict)}
+            for lab_id in list(self._labs):
+                if lab_id not in states:
+                    del self[lab_id]
+            for lab_id, state in states.items():
+                self[lab_id] = state
+
+    def snapshot(self):
+        """
+        Returns a plain dict copy, e.g. for JSON serialization.
+
+        Returns:
+        --------
+        dict: {lab_id: state}
+        """
+        with self._lock:
+            return {lab_id: dict(state) for lab_id, state in self._labs.items()}
+
+    def lab_ids_with_status(self, running_status):
+        """
+        Returns the lab ids with the given running_status.
+
+        Parameters:
+        -----------
+        running_status: str
+            The running status, e.g. "running".
+
+        Returns:
+        --------
+        set: The matching lab ids.
+        """
+        with self._lock:
+            return set(self._by_field["running_status"].get(running_status, ()))
+
+    def lab_ids_with_image(self, docker_image):
+        """
+        Returns the lab ids using the given docker_image.
+
+        Parameters:
+        -----------
+        docker_image: str
+            The docker image, e.g. "myrepo/some_image:latest".
+
+        Returns:
+        --------
+        set: The matching lab ids.
+        """
+        with self._lock:
+            return set(self._by_field["docker_image"].get(docker_image, ()))
+
+    def select(self, statuses=None, docker_image=None):
+        """
+        Returns the sorted lab ids matching all given filters.
+
+        Parameters:
+        -----------
+        statuses: list
+            Keep labs whose running_status is in this list. All if None.
+        docker_image: str
+            Keep labs using this docker image. All if None.
+
+        Returns:
+        --------
+        list: The matching lab ids, sorted.
+        """
+        with self._lock:
+            if statuses:
+                selected = set()
+                for running_status in statuses:
+                    selected |= self._by_field["running_status"].get(running_status, set())
+            else:
+                selected = set(self._labs)
+            if docker_image is not None:
+                selected &= self._by_field["docker_image"].get(docker_image, set())
+            return sorted(selected)
+
+    def query(self, statuses=None, docker_image=None, offset=0, limit=None):
+        """
+        Returns a page of labs matching the filters, ordered by lab_id.
+
+        Parameters:
+        -----------
+        statuses: list
+            Keep labs whose running_status is in this list. All if None.
+        docker_image: str
+            Keep labs using this docker image. All if None.
+        offset: int
+            The number of matching labs to skip.
+        limit: int
+            The maximum number of labs to return. All if None.
+
+        Returns:
+        --------
+        tuple: (total, [(lab_id, state), ...]) where total is the number of
+        matching labs before pagination and each state is a copy.
+        """
+        with self._lock:
+            lab_ids = self.select(statuses, docker_image)
+            end = None if limit is None else offset + limit
+            page = [(lab_id, dict(self._labs[lab_id])) for lab_id in lab_ids[offset:end]]
+            return len(lab_ids), page
@@ -0,0 +1,77 @@
+# External imports
+import fcntl
+import logging
+import os
+
+
+class LeaderElection:
+    """
+    Elects a single process among the gunicorn workers using an exclusive
+    file lock.
+
+    The lock is held for as long as the process keeps the file open. The OS
+    releases it when the process exits (including crashes), so another worker
+    can take over by calling acquire() again.
+
+    Attributes:
+    -----------
+    lock_path: str
+        The path of the lock file shared by all workers.
+    is_leader: bool
+        Whether this process currently holds the lock.
+
+    Methods:
+    --------
+    acquire()
+        Tries to take the lock without blocking.
+    release()
+        Releases the lock if held.
+    """
+
+    def __init__(self, lock_path):
+        """
+        Constructor for the LeaderElection class.
+
+        Parameters:
+        -----------
+        lock_path: str
+            The path of the lock file shared by all workers.
+        """
+        self.lock_path = lock_path
+        self._fd = None
+
+    @property
+    def is_leader(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """
+        Tries to take the lock without blocking.
+
+        Returns:
+        --------
+        bool: True if this process is (now) the leader, False otherwise.
+        """
+        if self._fd is not None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        logging.info("Process %d elected leader via %s", os.getpid(), self.lock_path)
+        return True
+
+    def release(self):
+        """
+        Releases the lock if held.
+        """
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
@@ -0,0 +1,189 @@
+# External imports
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_listener = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that hands the record to the listener thread untouched.
+
+    The stock QueueHandler formats the message in the calling thread before
+    enqueueing it. The queue here never leaves the process, so the record can
+    be passed as-is and all formatting happens on the listener thread. Callers
+    must therefore pass snapshots (strings, numbers, LabSummary, ...) as
+    arguments rather than live mutable objects.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO):
+    """
+    Route all logging through a queue so that formatting and I/O happen on a
+    background listener thread instead of the request thread.
+
+    Parameters:
+    -----------
+    level: int
+        The root logging level.
+
+    Returns:
+    --------
+    listener: QueueListener
+        The running listener (the same one on repeated calls).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush pending records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class StructuredMessage:
+    """
+    A log message made of an event name and key/value fields.
+
+    The fields are only rendered when a handler actually formats the record,
+    so a filtered-out record costs no string work.
+    """
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, **fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        parts = [self.event]
+        parts.extend(f"{key}={value}" for key, value in self.fields.items())
+        return " ".join(parts)
+
+
+class LabSummary:
+    """
+    A constant-size snapshot of a single lab's state for logging.
+
+    Used in place of dumping the whole container_states dict, so log cost per
+    request does not grow with the number of labs.
+    """
+
+    __slots__ = ("lab_id", "running_status", "port", "idle_seconds")
+
+    def __init__(self, lab_id, state):
+        self.lab_id = lab_id
+        self.running_status = state.get("running_status")
+        self.port = state.get("port")
+        last_activity = state.get("last_activity")
+        self.idle_seconds = None if last_activity is None else time.time() - last_activity
+
+    def __str__(self):
+        idle = "n/a" if self.idle_seconds is None else f"{self.idle_seconds:.0f}s"
+        return f"lab={self.lab_id} status={self.running_status} port={self.port} idle={idle}"
+
+
+class RateLimiter:
+    """
+    Allows at most one log record per key every `interval` seconds.
+
+    Suppressed calls are counted and reported with the next allowed record.
+    Each check is O(1), independent of how many keys are tracked.
+
+    Attributes:
+    -----------
+    interval: float
+        Minimum number of seconds between two records for the same key.
+    """
+
+    def __init__(self, interval=60.0):
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """
+        Check whether a record for `key` may be emitted now.
+
+        Parameters:
+        -----------
+        key: hashable
+            The rate limiting key, e.g. (call site, lab_id).
+
+        Returns:
+        --------
+        int or None: The number of records suppressed since the last emitted
+        one if a record may be emitted, None otherwise.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_emit.get(key)
+            if last is not None and (now - last) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return None
+            self._last_emit[key] = now
+            return self._suppressed.pop(key, 0)
+
+    def forget(self, key):
+        """Drop the bookkeeping for `key` (e.g. when a lab is deleted)."""
+        with self._lock:
+            self._last_emit.pop(key, None)
+            self._suppressed.pop(key, None)
+
+
+def log_throttled(limiter, key, level, msg, *args):
+    """
+    Log `msg % args` at `level` unless `limiter` suppresses `key`.
+
+    Parameters:
+    -----------
+    limiter: RateLimiter
+        The limiter guarding this call site.
+    key: hashable
+        The rate limiting key.
+    level: int
+        The logging level.
+    msg: str
+        The %-style format string.
+    args: tuple
+        Arguments for the format string, formatted lazily.
+    """
+    root = logging.getLogger()
+    if not root.isEnabledFor(level):
+        return
+    suppressed = limiter.allow(key)
+    if suppressed is None:
+        return
+    if suppressed:
+        root.log(level, msg + " (%d similar suppressed)", *args, suppressed)
+    else:
+        root.log(level, msg, *args)
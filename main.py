@@ -1,10 +1,12 @@
 import requests
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Query
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 import time
 import threading
 import subprocess
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
 from mongo_client import AtlasClient
 from bson import ObjectId
 import os
@@ -12,71 +14,312 @@ from dotenv import load_dotenv
 import logging
 from jinja2 import Environment, FileSystemLoader
 import json
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+import fcntl
+from lab_index import LabIndex
+from leader import LeaderElection
+from log_utils import setup_logging, log_throttled, LabSummary, RateLimiter, StructuredMessage
 
 load_dotenv()
 templates_dir = os.path.join(os.path.dirname(__file__), "templates")
 env = Environment(loader=FileSystemLoader(templates_dir))
-app = FastAPI()
-mongoclient = AtlasClient()
-container_states: Dict[str, Dict] = {}
+# Created in lifespan() so that importing this module has no side effects.
+mongoclient: AtlasClient = None
+container_states = LabIndex()
+container_states_dirty = threading.Event()
+
+# Poll endpoints are hit every few seconds per open loading page; log each
+# (call site, lab) at most once per interval.
+POLL_LOG_INTERVAL_SECONDS = 60
+poll_log_limiter = RateLimiter(POLL_LOG_INTERVAL_SECONDS)
 
 
 def save_container_states(file_path="container_states.json"):
     try:
         with open(file_path, "w") as f:
-            json.dump(container_states, f)
-        logging.info("Container states saved successfully.")
+            json.dump(container_states.snapshot(), f)
+        logging.debug("Container states saved successfully.")
     except Exception as e:
         logging.error(f"Error saving container states: {e}")
 
-def load_container_states(file_path="container_states.json"):
-    global container_states
+def load_persisted_activity(file_path="container_states.json") -> Dict[str, float]:
+    """
+    Read {lab_id: last_activity} from the persisted container states. Only the
+    activity is trusted; statuses come from Docker and Mongo.
+    """
     try:
         with open(file_path, "r") as f:
-            container_states = json.load(f)
-        logging.info("Container states loaded successfully.")
+            states = json.load(f)
     except FileNotFoundError:
         logging.info("No previous container states file found. Starting fresh.")
-        container_states = {}
+        return {}
     except Exception as e:
         logging.error(f"Error loading container states: {e}")
-        container_states = {}
+        return {}
+    return {
+        lab_id: state["last_activity"]
+        for lab_id, state in states.items()
+        if isinstance(state, dict) and state.get("last_activity")
+    }
+
+def mark_container_states_dirty():
+    """
+    Schedule container_states to be written by the leader's next flush.
+    Only the leader persists state; other workers share their changes through
+    Mongo and pick up everyone else's on the next refresh.
+    """
+    if leader_election.is_leader:
+        container_states_dirty.set()
+
+def flush_container_states():
+    """Write container_states to disk if it changed since the last flush."""
+    if container_states_dirty.is_set():
+        container_states_dirty.clear()
+        save_container_states()
 
 
 # TODO: Change this to 24 hours
 IDLE_TIMEOUT_SECONDS = 86400  # 24 hours
+IDLE_CHECK_INTERVAL_SECONDS = 3600
+STATE_FLUSH_INTERVAL_SECONDS = 5
+STATE_REFRESH_INTERVAL_SECONDS = 30
+LEADER_RETRY_SECONDS = 30
+# last_activity is mirrored to Mongo at most this often per lab so the leader
+# sees activity served by the other workers.
+ACTIVITY_SYNC_SECONDS = 300
+LEADER_LOCK_FILE = os.environ.get("LEADER_LOCK_FILE", "/tmp/qulabs-backend.lock")
+
+leader_election = LeaderElection(LEADER_LOCK_FILE)
+background_stop = threading.Event()
+activity_synced_at: Dict[str, float] = {}
+# Labs this worker is starting or registering, with a nesting count. Refreshes
+# leave their local state alone until the operation finishes.
+labs_in_progress: Dict[str, int] = {}
+labs_in_progress_lock = threading.Lock()
+
+# Bulk admin operations fan out over bounded pools so concurrent bulk requests
+# cannot overwhelm Docker, GitHub or Docker Hub. Registrations are slow (image
+# wait, git clone, claat) and get their own pool so bulk stop/start never
+# queue behind a rollout.
+BULK_MAX_WORKERS = int(os.environ.get("BULK_MAX_WORKERS", "8"))
+BULK_REGISTER_MAX_WORKERS = int(os.environ.get("BULK_REGISTER_MAX_WORKERS", "8"))
+bulk_executor = ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS, thread_name_prefix="bulk")
+register_executor = ThreadPoolExecutor(max_workers=BULK_REGISTER_MAX_WORKERS, thread_name_prefix="bulk-register")
+NGINX_LOCK_FILE = os.environ.get("NGINX_LOCK_FILE", "/tmp/qulabs-nginx.lock")
+
+LAB_FILTER = {"docker_image": {"$exists": True}, "port": {"$exists": True}}
+LAB_PROJECTION = {"port": 1, "docker_image": 1, "running_status": 1, "last_activity": 1}
+
+
+@contextmanager
+def lab_in_progress(lab_id: str):
+    """Protect a lab's local state from refreshes while it is being started or registered."""
+    with labs_in_progress_lock:
+        labs_in_progress[lab_id] = labs_in_progress.get(lab_id, 0) + 1
+    try:
+        yield
+    finally:
+        with labs_in_progress_lock:
+            labs_in_progress[lab_id] -= 1
+            if not labs_in_progress[lab_id]:
+                del labs_in_progress[lab_id]
+
+def record_activity(lab_id: str, state: Dict):
+    """Bump last_activity for a lab, mirroring it to Mongo at most every ACTIVITY_SYNC_SECONDS."""
+    now = time.time()
+    state["last_activity"] = now
+    if now - activity_synced_at.get(lab_id, 0) >= ACTIVITY_SYNC_SECONDS:
+        activity_synced_at[lab_id] = now
+        mongoclient.update("lab_design", {"_id": ObjectId(lab_id)}, {"$set": {"last_activity": now}})
+    mark_container_states_dirty()
+
+def list_containers() -> Dict[str, bool]:
+    """Return {container_name: is_running} for every container in a single `docker ps -a` call."""
+    result = subprocess.run(
+        ["sudo", "docker", "ps", "-a", "--format", "{{.Names}}\t{{.Status}}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"docker ps failed: {result.stdout.strip()}")
+    containers = {}
+    for line in result.stdout.splitlines():
+        name, _, status = line.partition("\t")
+        if name:
+            containers[name] = status.startswith("Up")
+    return containers
+
+def build_lab_state(doc: Dict, running_status: str, now: float, last_activity: float = 0) -> Dict:
+    """Build a container_states entry from a projected lab_design document."""
+    lab_id = str(doc["_id"])
+    previous = container_states.get(lab_id, {})
+    return {
+        "running_status": running_status,
+        "last_activity": max(previous.get("last_activity", 0), doc.get("last_activity") or 0, last_activity) or now,
+        "port": doc["port"],
+        "docker_image": doc["docker_image"],
+        "container_name": lab_id
+    }
 
-def init_idle_checker():
-    """Start a background thread that periodically checks for idle containers."""
-    if not container_states:
-        load_container_states()
-    logging.info("Initializing idle checker.")
-    logging.info(f"Initial container states: {container_states}")
-    def idle_checker():
-        
-        logging.info("Idle checker started.")
-        logging.info(f"Initial container states: {container_states}")
-        while True:
-            time.sleep(3600)  # TODO: Change this to one hour
-            now = time.time()
-            for lab_id, state in list(container_states.items()):
-                if state["running_status"] == "running":
-                    last_active = state["last_activity"]
-                    if (now - last_active) > IDLE_TIMEOUT_SECONDS:
-                        # Stop container
-                        container_name = state["container_name"]
-                        logging.info(f"Stopping container {container_name} due to inactivity.")
-                        subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True)
-                        subprocess.run(["sudo", "docker", "rm", container_name], capture_output=True)
-                        subprocess.run(["sudo", "docker", "system", "prune", "-a"], capture_output=True)
-                        # Mark as stopped
-                        state["running_status"] = "stopped"
-                        logging.info(f"Marked lab {lab_id} as 'stopped' due to inactivity.")
-                        save_container_states()
-    threading.Thread(target=idle_checker, daemon=True).start()
-
-init_idle_checker()
+def apply_container_states(states: Dict[str, Dict]):
+    """
+    Make container_states match `states` in place, except for labs this worker
+    is starting or registering, whose local state is left untouched.
+    """
+    with labs_in_progress_lock:
+        for lab_id in list(container_states):
+            if lab_id not in states and lab_id not in labs_in_progress:
+                del container_states[lab_id]
+        for lab_id, state in states.items():
+            if lab_id in labs_in_progress:
+                continue
+            if lab_id in container_states:
+                container_states[lab_id].update(state)
+            else:
+                container_states[lab_id] = state
+
+def refresh_container_states():
+    """Rebuild container_states from a single projected lab_design query."""
+    docs = mongoclient.find("lab_design", LAB_FILTER, projection=LAB_PROJECTION)
+    now = time.time()
+    apply_container_states({
+        str(doc["_id"]): build_lab_state(doc, doc.get("running_status", "stopped"), now)
+        for doc in docs
+    })
+
+def reconcile_container_states(persisted_activity: Dict[str, float]):
+    """
+    Rebuild container_states in one pass from a single container listing and
+    a single lab_design query, then push status corrections back to Mongo
+    with one update per status. Labs marked "starting" without a running
+    container are left alone: another worker may be starting them right now.
+    """
+    containers = list_containers()
+    docs = mongoclient.find("lab_design", LAB_FILTER, projection=LAB_PROJECTION)
+
+    now = time.time()
+    reconciled: Dict[str, Dict] = {}
+    corrections: Dict[str, list] = {"running": [], "stopped": []}
+    for doc in docs:
+        lab_id = str(doc["_id"])
+        if containers.get(lab_id):
+            running_status = "running"
+        elif doc.get("running_status") == "starting":
+            running_status = "starting"
+        else:
+            running_status = "stopped"
+        reconciled[lab_id] = build_lab_state(doc, running_status, now, persisted_activity.get(lab_id, 0))
+        if doc.get("running_status") != running_status:
+            corrections[running_status].append(doc["_id"])
+
+    apply_container_states(reconciled)
+    for running_status, ids in corrections.items():
+        if ids:
+            mongoclient.update_many("lab_design", {"_id": {"$in": ids}}, {"$set": {"running_status": running_status}})
+    save_container_states()
+    logging.info(StructuredMessage(
+        "reconciled", labs=len(reconciled), containers=len(containers),
+        running=sum(1 for state in reconciled.values() if state["running_status"] == "running"),
+        corrected=len(corrections["running"]) + len(corrections["stopped"])
+    ))
+
+def reap_idle_containers():
+    """
+    Stop and remove running containers idle for longer than IDLE_TIMEOUT_SECONDS.
+
+    Candidates come from Mongo, which every worker writes to, so labs started
+    by any worker are reaped. Each lab's idle time is the newest of the
+    last_activity mirrored to Mongo and the one held by this worker.
+    """
+    docs = mongoclient.find("lab_design", {"running_status": "running"}, projection={"last_activity": 1})
+    now = time.time()
+    unstamped = []
+    for doc in docs:
+        lab_id = str(doc["_id"])
+        state = container_states.get(lab_id)
+        last_active = max(doc.get("last_activity") or 0, state.get("last_activity", 0) if state else 0)
+        if not last_active:
+            # Started before activity was mirrored to Mongo; start the clock now.
+            unstamped.append(doc["_id"])
+            continue
+        if (now - last_active) > IDLE_TIMEOUT_SECONDS:
+            # Stop container
+            container_name = lab_id
+            logging.info(f"Stopping container {container_name} due to inactivity.")
+            subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True)
+            subprocess.run(["sudo", "docker", "rm", container_name], capture_output=True)
+            subprocess.run(["sudo", "docker", "system", "prune", "-a"], capture_output=True)
+            # Mark as stopped
+            if state:
+                state["running_status"] = "stopped"
+            mongoclient.update("lab_design", {"_id": doc["_id"]}, {"$set": {"running_status": "stopped"}})
+            logging.info(f"Marked lab {lab_id} as 'stopped' due to inactivity.")
+            mark_container_states_dirty()
+    if unstamped:
+        mongoclient.update_many("lab_design", {"_id": {"$in": unstamped}}, {"$set": {"last_activity": now}})
+
+def background_duties():
+    """
+    Runs in every worker. Every worker rebuilds its container_states from
+    Mongo every STATE_REFRESH_INTERVAL_SECONDS, so all workers serve the same
+    state. The worker holding the leader lock also reconciles state with
+    Docker (retrying until it succeeds), then flushes state to disk and reaps
+    idle containers.
+    """
+    last_election = last_refresh = last_reap = None
+    persisted_activity = None
+    reconciled = False
+    while True:
+        now = time.monotonic()
+        if not leader_election.is_leader and (last_election is None or now - last_election >= LEADER_RETRY_SECONDS):
+            last_election = now
+            if leader_election.acquire():
+                persisted_activity = load_persisted_activity()
+                last_reap = now
+
+        if leader_election.is_leader and not reconciled:
+            try:
+                reconcile_container_states(persisted_activity)
+                reconciled = True
+                last_refresh = now
+            except Exception as e:
+                logging.error(f"Error reconciling container states: {e}")
+
+        if last_refresh is None or now - last_refresh >= STATE_REFRESH_INTERVAL_SECONDS:
+            try:
+                refresh_container_states()
+                last_refresh = now
+            except Exception as e:
+                logging.error(f"Error refreshing container states: {e}")
+
+        if leader_election.is_leader:
+            flush_container_states()
+            if now - last_reap >= IDLE_CHECK_INTERVAL_SECONDS:
+                last_reap = now
+                try:
+                    reap_idle_containers()
+                except Exception as e:
+                    logging.error(f"Error reaping idle containers: {e}")
+
+        if background_stop.wait(STATE_FLUSH_INTERVAL_SECONDS):
+            break
+    if leader_election.is_leader:
+        flush_container_states()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup and shutdown."""
+    global mongoclient
+    setup_logging(logging.INFO)
+    mongoclient = AtlasClient()
+    background_stop.clear()
+    background_thread = threading.Thread(target=background_duties, daemon=True)
+    background_thread.start()
+    yield
+    background_stop.set()
+    background_thread.join(timeout=STATE_FLUSH_INTERVAL_SECONDS)
+    leader_election.release()
+
+
+app = FastAPI(lifespan=lifespan)
 
 def is_container_running(container_name: str) -> bool:
     """Check via `docker ps` if a container is running."""
@@ -84,8 +327,10 @@ def is_container_running(container_name: str) -> bool:
         ["sudo", "docker", "ps", "-q", "-f", f"name={container_name}"],
         capture_output=True, text=True
     )
-    logging.info(f"Checking if container {container_name} is running: {bool(result.stdout.strip())}")
-    return bool(result.stdout.strip())
+    running = bool(result.stdout.strip())
+    log_throttled(poll_log_limiter, ("is_container_running", container_name), logging.INFO,
+                  "Checking if container %s is running: %s", container_name, running)
+    return running
 
 def container_exists(container_name: str) -> bool:
     """Return True if a container with the exact name exists (running or not)."""
@@ -96,7 +341,7 @@ def container_exists(container_name: str) -> bool:
     ]
     result = subprocess.run(cmd, capture_output=True, text=True)
     exists = bool(result.stdout.strip())
-    logging.info(f"Container '{container_name}' exists: {exists}")
+    logging.info("Container '%s' exists: %s", container_name, exists)
     return exists
 
 def container_running(container_name: str) -> bool:
@@ -108,7 +353,7 @@ def container_running(container_name: str) -> bool:
     ]
     result = subprocess.run(cmd, capture_output=True, text=True)
     running = bool(result.stdout.strip())
-    logging.info(f"Container '{container_name}' running: {running}")
+    logging.info("Container '%s' running: %s", container_name, running)
     return running
 
 def start_existing_container(container_name: str, lab_id: str):
@@ -122,9 +367,9 @@ def start_existing_container(container_name: str, lab_id: str):
         text=True,
         bufsize=1
     )
-    for line in process.stdout:
-        logging.info(f"Docker start output: {line.strip()}")
-    process.wait()
+    output, _ = process.communicate()
+    logging.info(StructuredMessage("docker_start", lab=lab_id, container=container_name,
+                                   returncode=process.returncode, output=output.strip()))
     if process.returncode != 0:
         logging.error(f"Error starting container {container_name} for lab {lab_id}")
         raise Exception(f"Error starting container {container_name} for lab {lab_id}")
@@ -140,9 +385,9 @@ def run_new_container(container_name: str, docker_image: str, port: int, lab_id:
         text=True,
         bufsize=1
     )
-    for line in process.stdout:
-        logging.info(f"Docker run output: {line.strip()}")
-    process.wait()
+    output, _ = process.communicate()
+    logging.info(StructuredMessage("docker_run", lab=lab_id, container=container_name,
+                                   returncode=process.returncode, output=output.strip()))
     if process.returncode != 0:
         logging.error(f"Error running docker container for lab {lab_id}")
         raise Exception(f"Error running docker container for lab {lab_id}")
@@ -150,10 +395,19 @@ def run_new_container(container_name: str, docker_image: str, port: int, lab_id:
 
 def update_container_state_and_db(lab_id: str):
     """Mark the container as running, save state and update the database."""
-    container_states[lab_id]["running_status"] = "running"
-    save_container_states()
+    # Convert first so an invalid lab id cannot leave a local-only "running" state behind.
+    lab_object_id = ObjectId(lab_id)
+    state = container_states[lab_id]
+    state["running_status"] = "running"
+    mark_container_states_dirty()
     logging.info(f"Updating MongoDB status to 'running' for lab {lab_id}")
-    mongoclient.update("lab_design", {"_id": ObjectId(lab_id)}, {"$set": {"running_status": "running"}})
+    # Other workers rebuild their state from these fields, and the reaper needs last_activity.
+    mongoclient.update("lab_design", {"_id": lab_object_id}, {"$set": {
+        "running_status": "running",
+        "docker_image": state["docker_image"],
+        "port": state["port"],
+        "last_activity": state["last_activity"]
+    }})
     logging.info(f"Container state updated for lab {lab_id}")
 
 def run_container(lab_id: str, docker_image: str, port: int):
@@ -161,43 +415,51 @@ def run_container(lab_id: str, docker_image: str, port: int):
     Actually run the container (blocking). 
     This is called from a background thread if needed.
     """
-    # Update container_states for this lab
-    if lab_id not in container_states:
-        container_states[lab_id] = {
-            "running_status": "starting",
-            "last_activity": time.time(),
-            "port": port,
-            "docker_image": docker_image,
-            "container_name": lab_id
-        }
-    else:
-        container_states[lab_id].update({
-            "running_status": "starting",
-            "last_activity": time.time(),
-            "port": port,
-            "docker_image": docker_image,
-            "container_name": lab_id
-        })
-
-    logging.info(f"run_container() called with lab_id: {lab_id}, docker_image: {docker_image}, port: {port}")
-    container_name = container_states[lab_id]["container_name"]
-    logging.info(f"Retrieved container name: {container_name} for lab {lab_id}")
-
-    if container_exists(container_name):
-        if container_running(container_name):
-            logging.info(f"Container {container_name} is already running.")
+    lab_object_id = ObjectId(lab_id)
+    with lab_in_progress(lab_id):
+        # Update container_states for this lab
+        if lab_id not in container_states:
+            container_states[lab_id] = {
+                "running_status": "starting",
+                "last_activity": time.time(),
+                "port": port,
+                "docker_image": docker_image,
+                "container_name": lab_id
+            }
         else:
-            start_existing_container(container_name, lab_id)
-        # Update state and DB, then return
+            container_states[lab_id].update({
+                "running_status": "starting",
+                "last_activity": time.time(),
+                "port": port,
+                "docker_image": docker_image,
+                "container_name": lab_id
+            })
+        # Mirror "starting" (and the image/port being started) so other workers'
+        # refreshes neither start the lab a second time nor use a stale image or port.
+        mongoclient.update("lab_design", {"_id": lab_object_id}, {"$set": {
+            "running_status": "starting", "docker_image": docker_image, "port": port
+        }})
+
+        logging.info(f"run_container() called with lab_id: {lab_id}, docker_image: {docker_image}, port: {port}")
+        container_name = container_states[lab_id]["container_name"]
+        logging.info(f"Retrieved container name: {container_name} for lab {lab_id}")
+
+        try:
+            if container_exists(container_name):
+                if container_running(container_name):
+                    logging.info(f"Container {container_name} is already running.")
+                else:
+                    start_existing_container(container_name, lab_id)
+            else:
+                # If container does not exist, run a new one
+                run_new_container(container_name, docker_image, port, lab_id)
+        except Exception:
+            # Do not leave the lab stuck in "starting" for every worker.
+            container_states[lab_id]["running_status"] = "stopped"
+            mongoclient.update("lab_design", {"_id": lab_object_id}, {"$set": {"running_status": "stopped"}})
+            raise
         update_container_state_and_db(lab_id)
         logging.info(f"run_container() completed for lab {lab_id}")
-        return
-
-    # If container does not exist, run a new one
-    run_new_container(container_name, docker_image, port, lab_id)
-    update_container_state_and_db(lab_id)
-    logging.info(f"run_container() completed for lab {lab_id}")
-
 
 def get_repo(lab_id):
     GITHUB_USERNAME = os.environ.get("GITHUB_USERNAME")
@@ -209,18 +471,19 @@ def get_repo(lab_id):
     # Ensure the target directory exists (without sudo to maintain proper ownership)
     target_dir = "/home/ubuntu/QuLabs"
     os.makedirs(target_dir, exist_ok=True)
-    os.chdir(target_dir)
+    # Pass cwd instead of os.chdir(): labs are registered concurrently and the
+    # working directory is shared by every thread in the process.
+    lab_dir = os.path.join(target_dir, lab_id)
     
-    if not os.path.isdir(lab_id):
+    if not os.path.isdir(lab_dir):
         command = f"git clone https://github.com/{GITHUB_USERNAME}/{lab_id}.git"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=target_dir)
         logging.info("Git clone completed successfully.")
     else:
-        os.chdir(lab_id)
         command = "git pull origin main"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=lab_dir)
         logging.info("Git pull completed successfully.")
 
 def run_codelab(lab_id):
@@ -228,58 +491,63 @@ def run_codelab(lab_id):
     lab_doc = f"{lab_id}_documentation"
     lab_user_guide = f"{lab_id}_user_guide"
     
-    os.chdir(f"/home/ubuntu/QuLabs/{lab_id}")
+    lab_dir = f"/home/ubuntu/QuLabs/{lab_id}"
     
     # Export documentation.md
-    if not os.path.isdir(lab_doc):
+    if not os.path.isdir(os.path.join(lab_dir, lab_doc)):
         command = "claat export documentation.md"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=lab_dir)
         logging.info("Documentation export completed successfully.")
     else:
         command = f"rm -rf {lab_doc} && claat export documentation.md"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=lab_dir)
         logging.info("Documentation re-export completed successfully.")
         
     # Export user_guide.md
-    if not os.path.isdir(lab_user_guide):
+    if not os.path.isdir(os.path.join(lab_dir, lab_user_guide)):
         command = "claat export user_guide.md"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=lab_dir)
         logging.info("User guide export completed successfully.")
     else:
         command = f"rm -rf {lab_user_guide} && claat export user_guide.md"
         logging.info(f"Running command: {command}")
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, shell=True, check=True, cwd=lab_dir)
         logging.info("User guide re-export completed successfully.")
     
     # Create directories for documentation and user guide using sudo
     command = f"sudo mkdir -p /var/www/codelabs/{lab_id}/documentation"
     logging.info(f"Running command: {command}")
-    subprocess.run(command, shell=True, check=True)
+    subprocess.run(command, shell=True, check=True, cwd=lab_dir)
     logging.info("Created directory for documentation.")
     
     command = f"sudo mkdir -p /var/www/codelabs/{lab_id}/user_guide"
     logging.info(f"Running command: {command}")
-    subprocess.run(command, shell=True, check=True)
+    subprocess.run(command, shell=True, check=True, cwd=lab_dir)
     logging.info("Created directory for user guide.")
     
     # Copy files to the destination directories
     command = f"sudo cp -r {lab_doc}/. /var/www/codelabs/{lab_id}/documentation/"
     logging.info(f"Running command: {command}")
-    subprocess.run(command, shell=True, check=True)
+    subprocess.run(command, shell=True, check=True, cwd=lab_dir)
     logging.info("Copied documentation files.")
     
     command = f"sudo cp -r {lab_user_guide}/. /var/www/codelabs/{lab_id}/user_guide/"
     logging.info(f"Running command: {command}")
-    subprocess.run(command, shell=True, check=True)
+    subprocess.run(command, shell=True, check=True, cwd=lab_dir)
     logging.info("Copied user guide files.")
 
 def add_lab_sh_command(lab_id, port):
     command = f"/usr/local/bin/add_lab.sh {lab_id} {port}"
     logging.info(f"Running command: {command}")
-    subprocess.run(command, shell=True, check=True)
+    # add_lab.sh writes a conf file, runs `nginx -t` over every lab's conf and
+    # deletes its own file if the test fails, so a concurrent run can see a
+    # half-written conf and revert a valid lab. Serialize it across workers.
+    with open(NGINX_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        subprocess.run(command, shell=True, check=True)
     logging.info("add_lab.sh command executed successfully.")
 
 
@@ -339,39 +607,41 @@ def register_lab(data: dict):
     else:
         raise HTTPException(status_code=400, detail="Docker image not found")
 
-    # Initialize in container_states as "running" from the start
-    container_name = f"{lab_id}"
-    container_states[lab_id] = {
-        "running_status": "starting",
-        "last_activity": time.time(),
-        "port": port,
-        "docker_image": docker_image,
-        "container_name": container_name
-    }
+    # Keep refreshes from dropping or overwriting this lab until registration finishes.
+    with lab_in_progress(lab_id):
+        # Initialize in container_states as "running" from the start
+        container_name = f"{lab_id}"
+        container_states[lab_id] = {
+            "running_status": "starting",
+            "last_activity": time.time(),
+            "port": port,
+            "docker_image": docker_image,
+            "container_name": container_name
+        }
     
-    logging.info(f"Registering lab {lab_id} with Docker image {docker_image} on port {port}")
-    logging.info(container_states)
+        logging.info(f"Registering lab {lab_id} with Docker image {docker_image} on port {port}")
+        logging.info("%s", LabSummary(lab_id, container_states[lab_id]))
 
-    # Stop & remove if leftover container with same name
-    subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True)
-    subprocess.run(["sudo", "docker", "rm", container_name], capture_output=True)
-
-    # Run the container now
-    run_container(lab_id, docker_image, port)
+        # Stop & remove if leftover container with same name
+        subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True)
+        subprocess.run(["sudo", "docker", "rm", container_name], capture_output=True)
 
-    # pull the repo, run the codelab and update the nginx snippet
-    logging.info(f"Pulling repo for lab: {lab_id}")
-    get_repo(lab_id)
-    logging.info(f"Running codelab for lab: {lab_id}")
-    run_codelab(lab_id)
-    logging.info(f"Updating nginx snippet for lab: {lab_id}")
-    add_lab_sh_command(lab_id, port)
-    logging.info(f"Lab {lab_id} registered and started successfully.")
-    container_states[lab_id]["running_status"] = "running"
+        # Run the container now
+        run_container(lab_id, docker_image, port)
+
+        # pull the repo, run the codelab and update the nginx snippet
+        logging.info(f"Pulling repo for lab: {lab_id}")
+        get_repo(lab_id)
+        logging.info(f"Running codelab for lab: {lab_id}")
+        run_codelab(lab_id)
+        logging.info(f"Updating nginx snippet for lab: {lab_id}")
+        add_lab_sh_command(lab_id, port)
+        logging.info(f"Lab {lab_id} registered and started successfully.")
+        container_states[lab_id]["running_status"] = "running"
     
-    save_container_states()
+        mark_container_states_dirty()
 
-    return {"message": f"Lab {lab_id} registered and started successfully."}
+        return {"message": f"Lab {lab_id} registered and started successfully."}
 
 @app.delete("/labs/{lab_id}")
 def remove_app(lab_id: str):
@@ -383,11 +653,206 @@ def remove_app(lab_id: str):
         subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True)
         subprocess.run(["sudo", "docker", "rm", container_name], capture_output=True)
         del container_states[lab_id]
-        save_container_states()
+        mark_container_states_dirty()
+        poll_log_limiter.forget(("serve_lab_page", lab_id))
+        poll_log_limiter.forget(("status_endpoint", lab_id))
+        poll_log_limiter.forget(("is_container_running", container_name))
         logging.info(f"Lab {lab_id} deleted successfully.")
 
     return {"message": f"Lab {lab_id} deleted successfully."}
 
+
+@app.get("/labs")
+def list_labs(
+    status: Optional[List[str]] = Query(None),
+    docker_image: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500)
+):
+    """
+    List labs from the in-memory index, ordered by lab id. Every worker
+    rebuilds the index from Mongo every STATE_REFRESH_INTERVAL_SECONDS.
+    `status` may be repeated (?status=running&status=starting).
+    """
+    total, labs = container_states.query(
+        statuses=status, docker_image=docker_image,
+        offset=(page - 1) * page_size, limit=page_size
+    )
+    return {
+        "labs": [{"lab_id": lab_id, **state} for lab_id, state in labs],
+        "page": page,
+        "page_size": page_size,
+        "total": total
+    }
+
+
+def run_bulk(fn, lab_ids, executor=bulk_executor, on_result=None):
+    """
+    Call fn(lab_id) for every lab on `executor` and collect one result per
+    lab, in input order. A failure for one lab does not affect the others.
+    `on_result`, if given, is called with each result as soon as it is ready.
+    """
+    def run_one(lab_id):
+        try:
+            fn(lab_id)
+            result = {"lab_id": lab_id, "ok": True}
+        except HTTPException as e:
+            result = {"lab_id": lab_id, "ok": False, "error": e.detail}
+        except Exception as e:
+            logging.error(f"Bulk {fn.__name__} failed for lab {lab_id}: {e}")
+            result = {"lab_id": lab_id, "ok": False, "error": str(e)}
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    results = list(executor.map(run_one, lab_ids))
+    succeeded = sum(1 for result in results if result["ok"])
+    logging.info(StructuredMessage(f"bulk_{fn.__name__}", labs=len(results), succeeded=succeeded))
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+def select_bulk_lab_ids(data: dict) -> List[str]:
+    """
+    Resolve the labs targeted by a bulk request: either an explicit
+    "lab_ids" list, or a "status" and/or "docker_image" filter over the index.
+    """
+    if "lab_ids" in data:
+        lab_ids = data["lab_ids"]
+        if not isinstance(lab_ids, list):
+            raise HTTPException(status_code=400, detail="lab_ids must be a list")
+        if not all(isinstance(lab_id, str) for lab_id in lab_ids):
+            raise HTTPException(status_code=400, detail="lab_ids must be strings")
+        return list(dict.fromkeys(lab_ids))
+    status = data.get("status")
+    docker_image = data.get("docker_image")
+    if not status and not docker_image:
+        raise HTTPException(status_code=400, detail="Provide lab_ids, status or docker_image")
+    statuses = [status] if isinstance(status, str) else status
+    if statuses is not None and (
+        not isinstance(statuses, list) or not all(isinstance(item, str) for item in statuses)
+    ):
+        raise HTTPException(status_code=400, detail="status must be a string or a list of strings")
+    if docker_image is not None and not isinstance(docker_image, str):
+        raise HTTPException(status_code=400, detail="docker_image must be a string")
+    return container_states.select(statuses=statuses, docker_image=docker_image)
+
+def stop_lab(lab_id: str):
+    """Stop (but keep) a lab's container and mark it stopped."""
+    state = container_states.get(lab_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Lab not found")
+    container_name = state["container_name"]
+    result = subprocess.run(["sudo", "docker", "stop", container_name], capture_output=True, text=True)
+    if result.returncode != 0 and container_running(container_name):
+        raise Exception(f"Error stopping container {container_name}: {result.stderr.strip()}")
+    state["running_status"] = "stopped"
+
+def start_lab(lab_id: str):
+    """Start a lab's container unless it is already running or being started."""
+    state = container_states.get(lab_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Lab not found")
+    if state["running_status"] == "starting":
+        # A second run_container would race the first one on the same container name.
+        return
+    if state["running_status"] == "running" and container_running(state["container_name"]):
+        return
+    run_container(lab_id, state["docker_image"], state["port"])
+
+@app.post("/labs/bulk-register")
+def bulk_register_labs(data: dict):
+    """
+    Register many labs at once, concurrently, as a background job.
+    data = {
+      "labs": [
+        {"lab_id": "some_name", "docker_image": "myrepo/some_image:latest", "port": 8503},
+        ...
+      ]
+    }
+    Each lab goes through the same steps as /register_lab. Returns 202 with a
+    job id right away; poll /labs/bulk-jobs/{job_id} for per-lab progress.
+    Jobs live in Mongo so any worker can answer the poll.
+    """
+    labs = data.get("labs")
+    if not isinstance(labs, list) or not labs:
+        raise HTTPException(status_code=400, detail="labs must be a non-empty list")
+    labs_by_id = {}
+    for lab in labs:
+        if not isinstance(lab, dict) or not lab.get("lab_id") or not isinstance(lab["lab_id"], str):
+            raise HTTPException(status_code=400, detail="Every lab needs a string lab_id")
+        labs_by_id[lab["lab_id"]] = lab
+
+    lab_ids = list(labs_by_id)
+    job_id = mongoclient.insert("bulk_jobs", {
+        "kind": "register",
+        "status": "running",
+        "lab_ids": lab_ids,
+        "results": [],
+        "succeeded": 0,
+        "failed": 0,
+        "created_at": time.time()
+    })
+
+    def register_lab_by_id(lab_id):
+        register_lab(labs_by_id[lab_id])
+
+    def record_result(result):
+        counter = "succeeded" if result["ok"] else "failed"
+        mongoclient.update("bulk_jobs", {"_id": job_id}, {"$push": {"results": result}, "$inc": {counter: 1}})
+
+    def run_job():
+        try:
+            run_bulk(register_lab_by_id, lab_ids, executor=register_executor, on_result=record_result)
+            status = "completed"
+        except Exception as e:
+            logging.error(f"Bulk register job {job_id} failed: {e}")
+            status = "failed"
+        mongoclient.update("bulk_jobs", {"_id": job_id}, {"$set": {"status": status, "finished_at": time.time()}})
+
+    threading.Thread(target=run_job, daemon=True).start()
+    return JSONResponse(status_code=202, content={
+        "job_id": str(job_id),
+        "status_url": f"/labs/bulk-jobs/{job_id}",
+        "labs": len(lab_ids)
+    })
+
+@app.get("/labs/bulk-jobs/{job_id}")
+def bulk_job_status(job_id: str):
+    """Progress of a bulk job: status, per-lab results so far and counters."""
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    jobs = mongoclient.find("bulk_jobs", {"_id": ObjectId(job_id)})
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = jobs[0]
+    job["job_id"] = str(job.pop("_id"))
+    return job
+
+@app.post("/labs/bulk-stop")
+def bulk_stop_labs(data: dict):
+    """
+    Stop many labs at once, concurrently.
+    data = {"lab_ids": [...]} or {"status": "running", "docker_image": "myrepo/some_image:latest"}
+    """
+    lab_ids = select_bulk_lab_ids(data)
+    response = run_bulk(stop_lab, lab_ids)
+    stopped = [ObjectId(result["lab_id"]) for result in response["results"]
+               if result["ok"] and ObjectId.is_valid(result["lab_id"])]
+    if stopped:
+        mongoclient.update_many("lab_design", {"_id": {"$in": stopped}}, {"$set": {"running_status": "stopped"}})
+    mark_container_states_dirty()
+    return response
+
+@app.post("/labs/bulk-start")
+def bulk_start_labs(data: dict):
+    """
+    Start many labs at once, concurrently.
+    data = {"lab_ids": [...]} or {"status": "stopped", "docker_image": "myrepo/some_image:latest"}
+    """
+    lab_ids = select_bulk_lab_ids(data)
+    response = run_bulk(start_lab, lab_ids)
+    mark_container_states_dirty()
+    return response
+
 @app.get("/lab/{lab_id}", response_class=HTMLResponse)
 def serve_lab_page(lab_id: str, request: Request):
     """
@@ -402,8 +867,6 @@ def serve_lab_page(lab_id: str, request: Request):
     if not doc:
         return lab_does_not_exist_page(lab_id, request)
     doc = doc[0]
-    
-    logging.info(container_states)
 
     # If not in container_states, init it
     if lab_id not in container_states:
@@ -418,9 +881,9 @@ def serve_lab_page(lab_id: str, request: Request):
         
     port = container_states[lab_id]["port"]
     state = container_states[lab_id]
-    state["last_activity"] = time.time()
-    container_states[lab_id] = state
-    save_container_states()
+    record_activity(lab_id, state)
+    log_throttled(poll_log_limiter, ("serve_lab_page", lab_id), logging.INFO,
+                  "serve_lab_page %s", LabSummary(lab_id, state))
 
     # Check actual Docker status if state is running
     if state["running_status"] == "running":
@@ -455,7 +918,7 @@ def loading_page(lab_id: str, request: Request) -> HTMLResponse:
     Returns an HTML page that auto-polls /status/{lab_id} 
     to detect 'running' and then redirect automatically.
     """
-    logging.info("Lab id in loading page: " + lab_id)
+    logging.info("Lab id in loading page: %s", lab_id)
     template = env.get_template("loading_page.html")
     rendered_html = template.render(lab_id=lab_id)
     return HTMLResponse(content=rendered_html, status_code=200)
@@ -488,15 +951,12 @@ def status_endpoint(lab_id: str, request: Request):
             "docker_image": lab["docker_image"],
             "container_name": container_name
         }
-        container_states["running_status"] = "starting"
-        save_container_states()
         run_container(lab_id, lab["docker_image"], lab["port"])
-        container_states["running_status"] = "running"
-        save_container_states()
         
     state = container_states[lab_id]
-    state["last_activity"] = time.time()
-    logging.info(container_states)
+    record_activity(lab_id, state)
+    log_throttled(poll_log_limiter, ("status_endpoint", lab_id), logging.INFO,
+                  "status_endpoint %s", LabSummary(lab_id, state))
 
     if state["running_status"] == "starting" and is_container_running(state["container_name"]):
         state["running_status"] = "running"
@@ -506,7 +966,7 @@ def status_endpoint(lab_id: str, request: Request):
         state["running_status"] = "starting"
 
     url = f"http://{request.client.host}:{state['port']}/{lab_id}"
-    save_container_states()
+    mark_container_states_dirty()
     
     return {"running_status": state["running_status"], "url": url}
 
@@ -28,10 +28,12 @@ class AtlasClient ():
         Pings the MongoDB Atlas.
     get_collection(collection_name)
         Gets a collection from the database.
-    find(collection_name, filter={}, limit=0)
+    find(collection_name, filter={}, limit=0, projection=None)
         Finds documents in a collection.
     update(collection_name, filter, update)
         Updates documents in a collection.
+    update_many(collection_name, filter, update)
+        Updates all matching documents in a collection.
     insert(collection_name, data)
         Inserts a document in a collection.
     delete(collection_name, filter)
@@ -76,7 +78,7 @@ class AtlasClient ():
         collection = self.database[collection_name]
         return collection
 
-    def find(self, collection_name, filter={}, limit=0):
+    def find(self, collection_name, filter={}, limit=0, projection=None):
         """
         Finds documents in a collection.
 
@@ -88,6 +90,8 @@ class AtlasClient ():
             The filter to apply.
         limit: int
             The limit of documents to return.
+        projection: dict
+            The fields to return. All fields are returned if None.
 
         Returns:
         --------
@@ -95,7 +99,7 @@ class AtlasClient ():
             The list of documents.
         """
         collection = self.database[collection_name]
-        items = list(collection.find(filter=filter, limit=limit))
+        items = list(collection.find(filter=filter, projection=projection, limit=limit))
         return items
 
     def update(self, collection_name, filter, update):
@@ -119,6 +123,26 @@ class AtlasClient ():
         collection.update_one(filter, update)
         return True
 
+    def update_many(self, collection_name, filter, update):
+        """
+        Updates all matching documents in a collection.
+
+        Parameters:
+        -----------
+        collection_name: str
+            The name of the collection.
+        filter: dict
+            The filter to apply.
+        update: dict
+            The update to apply.
+
+        Returns:
+        --------
+        int: The number of modified documents.
+        """
+        collection = self.database[collection_name]
+        return collection.update_many(filter, update).modified_count
+
     def insert(self, collection_name, data):
         """
         Inserts a document in a collection.